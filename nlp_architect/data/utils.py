@@ -16,13 +16,21 @@
 from __future__ import absolute_import, division, print_function
 
 import csv
+import mmap
 import os
 import random
+import re
 import sys
 from abc import ABC
 from io import open
+from itertools import groupby
 from typing import List, Tuple
 
+# "\n" separated blank lines, splits column tagged files into blocks of sentences
+BLANK_LINES_REGEX = re.compile(rb"\n\s*\n")
+# the line breaks of text mode (universal newlines)
+LINE_BREAKS_REGEX = re.compile("\r\n?|\n")
+
 
 class InputExample(ABC):
     """Base class for a single training/dev/test example """
@@ -104,26 +112,36 @@ def read_column_tagged_file(filename: str, tag_col: int = -1, ignore_token: str
     return format :
     [ ['token', 'TAG'], ['token', 'TAG2'],... ]
     """
+    if os.path.getsize(filename) == 0:
+        return []
+    # split the memory mapped file on bytes and decode one block at a time. The byte
+    # level split only catches "\n" separated blank lines, blocks may still hold several
+    # sentences (e.g. files with bare "\r" line endings or non-breaking space lines),
+    # which are separated below once the block is split into lines
+    with open(filename, "rb") as fp, mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        blocks = BLANK_LINES_REGEX.split(mm)
+    # corpora repeat the same tokens and tags many times, intern them so that
+    # equal strings share a single object
+    intern = sys.intern
     data = []
-    sentence = []
-    labels = []
-    with open(filename) as fp:
-        for line in fp:
-            line = line.strip()
-            if len(line) == 0:
-                if len(sentence) > 0:
-                    data.append((sentence, labels))
-                    sentence = []
-                    labels = []
+    for block in blocks:
+        # split on the line breaks of text mode only, str.splitlines() would also
+        # break lines on characters such as \x85 or \u2028
+        lines = LINE_BREAKS_REGEX.split(block.decode("utf-8"))
+        # lines of non-ASCII whitespace only (e.g. non-breaking spaces) separate
+        # sentences as well
+        for is_row, rows in groupby(map(str.split, lines), key=bool):
+            if not is_row:
+                continue
+            rows = [splits for splits in rows if splits[0] != ignore_token]
+            if len(rows) == 0:
                 continue
-            splits = line.split()
-            token = splits[0]
-            if token != ignore_token:
-                sentence.append(token)
-                labels.append(splits[tag_col])
-
-    if len(sentence) > 0:
-        data.append((sentence, labels))
+            data.append(
+                (
+                    [intern(splits[0]) for splits in rows],
+                    [intern(splits[tag_col]) for splits in rows],
+                )
+            )
     return data
 
 
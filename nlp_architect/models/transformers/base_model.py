@@ -423,13 +423,18 @@ class TransformerBase(TrainableModel):
         logger.info("\n\nBest dev=%s. test=%s\n", str(new_best_dev), str(new_test_dev))
         return new_best_dev, new_test_dev
 
-    def _evaluate(self, data_set: DataLoader):
+    def _run_model(self, data_set: DataLoader):
+        """Run the model in evaluation mode on each batch of the given data set
+
+        Args:
+            data_set (DataLoader): data set
+
+        Yields:
+            Tuple: the batch (on the model's device), the model inputs and the model outputs
+        """
         logger.info("***** Running inference *****")
-        logger.info(" Batch size: {}".format(data_set.batch_size))
-        eval_loss = 0.0
-        nb_eval_steps = 0
-        preds = None
-        out_label_ids = None
+        if data_set.batch_size is not None:
+            logger.info(" Batch size: {}".format(data_set.batch_size))
         for batch in tqdm(data_set, desc="Inference iteration"):
             self.model.eval()
             batch = tuple(t.to(self.device) for t in batch)
@@ -437,11 +442,19 @@ class TransformerBase(TrainableModel):
             with torch.no_grad():
                 inputs = self._batch_mapper(batch)
                 outputs = self.model(**inputs)
-                if "labels" in inputs:
-                    tmp_eval_loss, logits = outputs[:2]
-                    eval_loss += tmp_eval_loss.mean().item()
-                else:
-                    logits = outputs[0]
+            yield batch, inputs, outputs
+
+    def _evaluate(self, data_set: DataLoader):
+        eval_loss = 0.0
+        nb_eval_steps = 0
+        preds = None
+        out_label_ids = None
+        for _, inputs, outputs in self._run_model(data_set):
+            if "labels" in inputs:
+                tmp_eval_loss, logits = outputs[:2]
+                eval_loss += tmp_eval_loss.mean().item()
+            else:
+                logits = outputs[0]
             nb_eval_steps += 1
             model_output = logits.detach().cpu()
             model_out_label_ids = inputs["labels"].detach().cpu() if "labels" in inputs else None
@@ -464,9 +477,9 @@ class TransformerBase(TrainableModel):
             "input_ids": batch[0],
             "attention_mask": batch[1],
             # XLM don't use segment_ids
-            "token_type_ids": batch[2]
-            if self.model_type in ["bert", "quant_bert", "xlnet"]
-            else None,
+            "token_type_ids": (
+                batch[2] if self.model_type in ["bert", "quant_bert", "xlnet"] else None
+            ),
         }
         if len(batch) == 4:
             mapping.update({"labels": batch[3]})
@@ -13,13 +13,20 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 # ******************************************************************************
+import hashlib
 import logging
-from typing import List, Union
+import os
+import tempfile
+from functools import partial
+from itertools import islice
+from typing import Iterable, List, Union
 
+import numpy as np
 import torch
+from joblib import Parallel, delayed
 from torch.nn import CrossEntropyLoss, Dropout, Linear
 from torch.nn import functional as F
-from torch.utils.data import DataLoader, SequentialSampler, TensorDataset
+from torch.utils.data import DataLoader, TensorDataset
 from transformers import (
     ROBERTA_PRETRAINED_MODEL_ARCHIVE_MAP,
     BertForTokenClassification,
@@ -247,6 +254,306 @@ class RobertaForTokenClassificationHead(BertPreTrainedModel):
         return (logits,)
 
 
+class TokenClsFeatures(object):
+    """Features of a set of token classification examples in a columnar layout.
+    Each field is stored as a single flat array of the concatenated (unpadded)
+    sequences, the i-th example spans `offsets[i]:offsets[i + 1]`.
+    Indexing returns an `InputFeatures` view of a single example.
+    `valid_ids` marks the first word piece of every word, the token classification
+    heads compute the loss and `inference` reads the predictions only at these
+    positions (word piece continuations are labeled with the padding label).
+    Fields are stored with the narrowest sufficient dtypes and are widened to
+    int64 only when padded into tensors.
+    """
+
+    dtypes = {
+        "input_ids": np.int32,
+        "input_mask": np.uint8,
+        "segment_ids": np.uint8,
+        "valid_ids": np.uint8,
+        "label_id": np.int16,
+    }
+
+    def __init__(self, offsets, input_ids, input_mask, segment_ids, valid_ids, label_id=None):
+        self.offsets = offsets
+        self.input_ids = input_ids
+        self.input_mask = input_mask
+        self.segment_ids = segment_ids
+        self.valid_ids = valid_ids
+        self.label_id = label_id
+
+    @property
+    def lengths(self):
+        """sequence length of each example"""
+        return np.diff(self.offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        span = slice(self.offsets[i], self.offsets[i + 1])
+        return InputFeatures(
+            input_ids=self.input_ids[span],
+            input_mask=self.input_mask[span],
+            segment_ids=self.segment_ids[span],
+            label_id=self.label_id[span] if self.label_id is not None else None,
+            valid_ids=self.valid_ids[span],
+        )
+
+    def save(self, path: str):
+        """Save features to a .npz file. The file is written under a temporary name
+        and then moved into place, so an interrupted save never leaves a partial file
+        """
+        arrays = {
+            "offsets": self.offsets,
+            "input_ids": self.input_ids,
+            "input_mask": self.input_mask,
+            "segment_ids": self.segment_ids,
+            "valid_ids": self.valid_ids,
+        }
+        if self.label_id is not None:
+            arrays["label_id"] = self.label_id
+        fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(path) or None)
+        try:
+            with os.fdopen(fd, "wb") as fp:
+                np.savez(fp, **arrays)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    @classmethod
+    def load(cls, path: str):
+        """Load features saved with `save`"""
+        with np.load(path) as arrays:
+            return cls(
+                arrays["offsets"],
+                arrays["input_ids"],
+                arrays["input_mask"],
+                arrays["segment_ids"],
+                arrays["valid_ids"],
+                arrays["label_id"] if "label_id" in arrays else None,
+            )
+
+    @classmethod
+    def from_features(cls, features: List[InputFeatures]):
+        """Pack a list of `InputFeatures` into a `TokenClsFeatures`"""
+        offsets = np.zeros(len(features) + 1, dtype=np.int64)
+        np.cumsum([len(f.input_ids) for f in features], out=offsets[1:])
+
+        def concat(name):
+            return np.concatenate(
+                [np.asarray(getattr(f, name), dtype=cls.dtypes[name]) for f in features]
+                or [np.zeros(0, dtype=cls.dtypes[name])]
+            )
+
+        include_labels = len(features) > 0 and features[0].label_id is not None
+        return cls(
+            offsets,
+            concat("input_ids"),
+            concat("input_mask"),
+            concat("segment_ids"),
+            concat("valid_ids"),
+            concat("label_id") if include_labels else None,
+        )
+
+    @classmethod
+    def concat(cls, features_list: List["TokenClsFeatures"]):
+        """Concatenate several `TokenClsFeatures` into one"""
+        if len(features_list) == 0:
+            return cls.from_features([])
+        offsets = [np.zeros(1, dtype=np.int64)]
+        shift = 0
+        for f in features_list:
+            offsets.append(f.offsets[1:] + shift)
+            shift += f.offsets[-1]
+        include_labels = len(features_list) > 0 and features_list[0].label_id is not None
+        return cls(
+            np.concatenate(offsets),
+            *[
+                np.concatenate([getattr(f, name) for f in features_list])
+                for name in ("input_ids", "input_mask", "segment_ids", "valid_ids")
+            ],
+            label_id=(
+                np.concatenate([f.label_id for f in features_list]) if include_labels else None
+            ),
+        )
+
+
+def _convert_token_examples(
+    examples: List[TokenClsInputExample],
+    max_seq_length,
+    tokenizer,
+    label_map=None,
+    cls_token_at_end=False,
+    cls_token="[CLS]",
+    sep_token="[SEP]",
+    sequence_segment_id=0,
+    sep_token_extra=0,
+    cls_token_segment_id=1,
+    mask_padding_with_zero=True,
+) -> TokenClsFeatures:
+    """Convert a batch of token classification examples into unpadded `TokenClsFeatures`
+    (module level so that it can be dispatched to worker processes)
+    """
+    label_pad = 0
+    cls_token_id, sep_token_id = tokenizer.convert_tokens_to_ids([cls_token, sep_token])
+    # word -> word piece ids; each distinct word is tokenized only once
+    word_piece_ids = {}
+    # bind hot loop lookups once
+    get_piece_ids = word_piece_ids.get
+    tokenize = tokenizer.tokenize
+    convert_tokens_to_ids = tokenizer.convert_tokens_to_ids
+    unk_token = tokenizer.unk_token
+    get_label_id = label_map.get if label_map is not None else None
+
+    # [CLS] and [SEP] added by the tokenizer to a single sequence (plus the extra
+    # [SEP] of roberta), the rest of the max_seq_length budget is for word pieces
+    special_tokens_count = tokenizer.num_added_tokens() + (1 if sep_token_extra else 0)
+    # preallocate for the longest possible sequences, trimmed when done
+    capacity = len(examples) * max_seq_length
+    offsets = np.zeros(len(examples) + 1, dtype=np.int64)
+    dtypes = TokenClsFeatures.dtypes
+    input_ids = np.empty(capacity, dtype=dtypes["input_ids"])
+    segment_ids = np.full(capacity, sequence_segment_id, dtype=dtypes["segment_ids"])
+    valid_ids = np.zeros(capacity, dtype=dtypes["valid_ids"])
+    label_ids = None
+    if label_map is not None:
+        # label sets are usually small enough for int8
+        label_dtype = np.int8 if len(label_map) <= np.iinfo(np.int8).max else dtypes["label_id"]
+        label_ids = np.full(capacity, label_pad, dtype=label_dtype)
+
+    # word piece counts and label ids of every word in the batch, along with the
+    # start position and word piece budget of each example, for aligning
+    # valid ids and labels to the first word piece of each word in one pass
+    word_lens = []
+    word_label_ids = []
+    example_words = np.zeros(len(examples), dtype=np.int64)
+    example_starts = np.zeros(len(examples), dtype=np.int64)
+    example_num_tokens = np.zeros(len(examples), dtype=np.int64)
+
+    pos = 0
+    for ex_index, example in enumerate(examples):
+        tokens_ids = []
+        for token in example.tokens:
+            piece_ids = get_piece_ids(token)
+            if piece_ids is None:
+                # words of only control or format characters (e.g. a soft hyphen) have
+                # no word pieces, they are kept as an unknown token to keep their label
+                piece_ids = convert_tokens_to_ids(tokenize(token) or [unk_token])
+                word_piece_ids[token] = piece_ids
+            tokens_ids.extend(piece_ids)
+            word_lens.append(len(piece_ids))
+        if get_label_id is not None:
+            word_label_ids.extend(map(get_label_id, example.label[: len(example.tokens)]))
+
+        # truncate by max_seq_length
+        num_tokens = min(len(tokens_ids), max_seq_length - special_tokens_count)
+        seq_length = num_tokens + special_tokens_count
+        # word pieces are followed by [SEP] (twice for roberta) and
+        # preceded by [CLS], unless [CLS] is at the end (xlnet)
+        start = pos if cls_token_at_end else pos + 1
+        end = start + num_tokens
+        cls_index = pos + seq_length - 1 if cls_token_at_end else pos
+
+        input_ids[start:end] = tokens_ids[:num_tokens]
+        input_ids[end : end + special_tokens_count - 1] = sep_token_id
+        input_ids[cls_index] = cls_token_id
+        segment_ids[cls_index] = cls_token_segment_id
+        example_words[ex_index] = len(example.tokens)
+        example_starts[ex_index] = start
+        example_num_tokens[ex_index] = num_tokens
+
+        pos += seq_length
+        offsets[ex_index + 1] = pos
+
+    # offset of each word's first word piece within its example
+    word_lens = np.array(word_lens, dtype=np.int64)
+    word_offsets = np.cumsum(word_lens) - word_lens
+    first_words = np.cumsum(example_words) - example_words
+    word_offsets -= np.repeat(
+        word_offsets[first_words[example_words > 0]], example_words[example_words > 0]
+    )
+    # drop words truncated by max_seq_length
+    kept = word_offsets < np.repeat(example_num_tokens, example_words)
+    first_pieces = (word_offsets + np.repeat(example_starts, example_words))[kept]
+    valid_ids[first_pieces] = 1
+    if label_ids is not None:
+        label_ids[first_pieces] = np.array(word_label_ids, dtype=label_ids.dtype)[kept]
+
+    return TokenClsFeatures(
+        offsets,
+        input_ids[:pos].copy(),
+        np.full(pos, 1 if mask_padding_with_zero else 0, dtype=dtypes["input_mask"]),
+        segment_ids[:pos].copy(),
+        valid_ids[:pos].copy(),
+        label_ids[:pos].copy() if label_ids is not None else None,
+    )
+
+
+def pad_collate(
+    batch: Union[TokenClsFeatures, List[InputFeatures]],
+    pad_token=0,
+    pad_token_segment_id=0,
+    label_pad=0,
+    pad_on_left=False,
+    mask_padding_with_zero=True,
+    max_length=None,
+    pad_to_multiple_of=None,
+):
+    """Pad a batch of variable length token classification features into tensors.
+    Can be used as a DataLoader `collate_fn` (with `functools.partial`) in order to
+    pad each mini-batch only up to its longest sequence.
+
+    Args:
+        batch (Union[TokenClsFeatures, List[InputFeatures]]): features to pad
+        pad_token (int, optional): input ids padding value. Defaults to 0.
+        pad_token_segment_id (int, optional): segment ids padding value. Defaults to 0.
+        label_pad (int, optional): label ids padding value. Defaults to 0.
+        pad_on_left (bool, optional): pad on the left (xlnet). Defaults to False.
+        mask_padding_with_zero (bool, optional): mask padded positions with 0.
+        Defaults to True.
+        max_length (int, optional): length to pad to. Defaults to the longest
+        sequence in the batch.
+        pad_to_multiple_of (int, optional): round the padded length up to a multiple
+        of this value. Defaults to None.
+
+    Returns:
+        Tuple of tensors: input ids, input mask, segment ids, valid ids and label ids
+        (if the features include labels)
+    """
+    if not isinstance(batch, TokenClsFeatures):
+        batch = TokenClsFeatures.from_features(batch)
+    lengths = batch.lengths
+    if max_length is None:
+        max_length = int(lengths.max()) if len(lengths) > 0 else 0
+    if pad_to_multiple_of:
+        max_length = -(-max_length // pad_to_multiple_of) * pad_to_multiple_of
+
+    # (row, column) position of every flat element in the padded batch
+    rows = np.repeat(np.arange(len(batch)), lengths)
+    cols = np.arange(batch.offsets[-1] - batch.offsets[0]) - np.repeat(
+        batch.offsets[:-1] - batch.offsets[0], lengths
+    )
+    if pad_on_left:
+        cols += np.repeat(max_length - lengths, lengths)
+
+    def pad(values, pad_value):
+        padded = np.full((len(batch), max_length), pad_value, dtype=np.int64)
+        padded[rows, cols] = values
+        return torch.from_numpy(padded)
+
+    tensors = (
+        pad(batch.input_ids, pad_token),
+        pad(batch.input_mask, 0 if mask_padding_with_zero else 1),
+        pad(batch.segment_ids, pad_token_segment_id),
+        pad(batch.valid_ids, 0),
+    )
+    if batch.label_id is not None:
+        tensors += (pad(batch.label_id, label_pad),)
+    return tensors
+
+
 class TransformerTokenClassifier(TransformerBase):
     """
     Transformer word tagging classifier
@@ -390,6 +697,10 @@ class TransformerTokenClassifier(TransformerBase):
         examples: List[TokenClsInputExample],
         max_seq_length: int = 128,
         include_labels: bool = True,
+        n_jobs: int = 1,
+        cache_dir: str = None,
+        overwrite_cache: bool = False,
+        pad_to_multiple_of: int = 8,
     ) -> TensorDataset:
         """
         Convert examples to tensor dataset
@@ -398,40 +709,168 @@ class TransformerTokenClassifier(TransformerBase):
             examples (List[SequenceClsInputExample]): examples
             max_seq_length (int, optional): max sequence length. Defaults to 128.
             include_labels (bool, optional): include labels. Defaults to True.
+            n_jobs (int, optional): number of worker processes used for converting
+            examples (-1 for all CPUs). Defaults to 1.
+            cache_dir (str, optional): directory for caching converted features.
+            Defaults to None (no caching).
+            overwrite_cache (bool, optional): re-convert and overwrite cached features.
+            Defaults to False.
+            pad_to_multiple_of (int, optional): pad the sequence length up to a multiple
+            of this value (sequences are still truncated by max_seq_length); the extra
+            positions are masked padding and do not affect loss or metrics.
+            Defaults to 8.
 
         Returns:
             TensorDataset:
         """
+        features = self.convert_to_features(
+            examples,
+            max_seq_length,
+            include_labels,
+            n_jobs,
+            cache_dir=cache_dir,
+            overwrite_cache=overwrite_cache,
+        )
+        return TensorDataset(
+            *pad_collate(
+                features,
+                max_length=max_seq_length,
+                pad_to_multiple_of=pad_to_multiple_of,
+                **self.padding_args(),
+            )
+        )
+
+    def convert_to_features(
+        self,
+        examples: List[TokenClsInputExample],
+        max_seq_length: int = 128,
+        include_labels: bool = True,
+        n_jobs: int = 1,
+        cache_dir: str = None,
+        overwrite_cache: bool = False,
+    ) -> TokenClsFeatures:
+        """
+        Convert examples to unpadded features, to be batched with `pad_collate`
+
+        Args:
+            examples (List[SequenceClsInputExample]): examples
+            max_seq_length (int, optional): max sequence length. Defaults to 128.
+            include_labels (bool, optional): include labels. Defaults to True.
+            n_jobs (int, optional): number of worker processes used for converting
+            examples (-1 for all CPUs). Defaults to 1.
+            cache_dir (str, optional): directory for caching converted features.
+            Defaults to None (no caching).
+            overwrite_cache (bool, optional): re-convert and overwrite cached features.
+            Defaults to False.
+
+        Returns:
+            TokenClsFeatures:
+        """
+        cached_features_file = None
+        if cache_dir is not None:
+            cached_features_file = os.path.join(
+                cache_dir,
+                "cached_token_features_{}.npz".format(
+                    self._features_cache_key(examples, max_seq_length, include_labels)
+                ),
+            )
+            if os.path.exists(cached_features_file) and not overwrite_cache:
+                logger.info("Loading features from cached file %s", cached_features_file)
+                return TokenClsFeatures.load(cached_features_file)
+
         features = self._convert_examples_to_features(
             examples,
             max_seq_length,
             self.tokenizer,
             include_labels,
+            n_jobs=n_jobs,
             # xlnet has a cls token at the end
             cls_token_at_end=bool(self.model_type in ["xlnet"]),
             cls_token=self.tokenizer.cls_token,
             cls_token_segment_id=2 if self.model_type in ["xlnet"] else 0,
             sep_token=self.tokenizer.sep_token,
             sep_token_extra=bool(self.model_type in ["roberta"]),
-            # pad on the left for xlnet
-            pad_on_left=bool(self.model_type in ["xlnet"]),
-            pad_token=self.tokenizer.convert_tokens_to_ids([self.tokenizer.pad_token])[0],
-            pad_token_segment_id=4 if self.model_type in ["xlnet"] else 0,
         )
-        # Convert to Tensors and build dataset
-        all_input_ids = torch.tensor([f.input_ids for f in features], dtype=torch.long)
-        all_input_mask = torch.tensor([f.input_mask for f in features], dtype=torch.long)
-        all_segment_ids = torch.tensor([f.segment_ids for f in features], dtype=torch.long)
-        all_valid_ids = torch.tensor([f.valid_ids for f in features], dtype=torch.long)
+        if cached_features_file is not None:
+            logger.info("Saving features into cached file %s", cached_features_file)
+            features.save(cached_features_file)
+        return features
 
-        if include_labels:
-            all_label_ids = torch.tensor([f.label_id for f in features], dtype=torch.long)
-            dataset = TensorDataset(
-                all_input_ids, all_input_mask, all_segment_ids, all_valid_ids, all_label_ids
+    def convert_to_shards(
+        self,
+        examples: Iterable[TokenClsInputExample],
+        shard_dir: str,
+        max_seq_length: int = 128,
+        include_labels: bool = True,
+        n_jobs: int = 1,
+        shard_size: int = 50000,
+    ) -> List[str]:
+        """
+        Convert a stream of examples to features saved in shards of `shard_size`
+        examples, only a single shard of examples and features is held in memory.
+        Each shard can be loaded with `TokenClsFeatures.load`.
+
+        Args:
+            examples (Iterable[SequenceClsInputExample]): examples, can be a generator
+            shard_dir (str): directory to save the shards in
+            max_seq_length (int, optional): max sequence length. Defaults to 128.
+            include_labels (bool, optional): include labels. Defaults to True.
+            n_jobs (int, optional): number of worker processes used for converting
+            examples (-1 for all CPUs). Defaults to 1.
+            shard_size (int, optional): number of examples in each shard.
+            Defaults to 50000.
+
+        Returns:
+            List[str]: paths of the saved shards, in the order of the examples
+        """
+        os.makedirs(shard_dir, exist_ok=True)
+        examples = iter(examples)
+        shard_paths = []
+        while True:
+            shard = list(islice(examples, shard_size))
+            if len(shard) == 0:
+                break
+            features = self.convert_to_features(shard, max_seq_length, include_labels, n_jobs)
+            shard_path = os.path.join(
+                shard_dir, "token_features_{:05d}.npz".format(len(shard_paths))
             )
-        else:
-            dataset = TensorDataset(all_input_ids, all_input_mask, all_segment_ids, all_valid_ids)
-        return dataset
+            logger.info("Saving features shard %s", shard_path)
+            features.save(shard_path)
+            shard_paths.append(shard_path)
+        return shard_paths
+
+    def _features_cache_key(self, examples, max_seq_length, include_labels) -> str:
+        """Digest of everything converted features depend on: the examples, the
+        tokenizer, the labels and the conversion arguments"""
+        key = hashlib.sha1()
+        key.update(
+            repr(
+                (
+                    self.model_type,
+                    type(self.tokenizer).__name__,
+                    self.tokenizer_name or self.model_name_or_path,
+                    self.do_lower_case,
+                    len(self.tokenizer),
+                    self.labels,
+                    max_seq_length,
+                    include_labels,
+                )
+            ).encode("utf-8")
+        )
+        for example in examples:
+            key.update("\n{}".format(" ".join(example.tokens)).encode("utf-8"))
+            if include_labels:
+                key.update("\t{}".format(" ".join(example.label)).encode("utf-8"))
+        return key.hexdigest()
+
+    def padding_args(self):
+        """Model specific padding arguments of `pad_collate`"""
+        return {
+            # pad on the left for xlnet
+            "pad_on_left": bool(self.model_type in ["xlnet"]),
+            "pad_token": self.tokenizer.convert_tokens_to_ids([self.tokenizer.pad_token])[0],
+            "pad_token_segment_id": 4 if self.model_type in ["xlnet"] else 0,
+        }
 
     def _convert_examples_to_features(
         self,
@@ -439,16 +878,9 @@ class TransformerTokenClassifier(TransformerBase):
         max_seq_length,
         tokenizer,
         include_labels=True,
-        cls_token_at_end=False,
-        pad_on_left=False,
-        cls_token="[CLS]",
-        sep_token="[SEP]",
-        pad_token=0,
-        sequence_segment_id=0,
-        sep_token_extra=0,
-        cls_token_segment_id=1,
-        pad_token_segment_id=0,
-        mask_padding_with_zero=True,
+        n_jobs=1,
+        batch_size=1000,
+        **kwargs,
     ):
         """Loads a data file into a list of `InputBatch`s
         `cls_token_at_end` define the location of the CLS token:
@@ -456,103 +888,35 @@ class TransformerTokenClassifier(TransformerBase):
             - True (XLNet/GPT pattern): A + [SEP] + B + [SEP] + [CLS]
         `cls_token_segment_id` define the segment id associated to the CLS token
         (0 for BERT, 2 for XLNet)
+        Examples are converted in batches of `batch_size`, using `n_jobs` worker
+        processes when `n_jobs` > 1 (-1 uses all CPUs).
         """
-
+        label_map = None
         if include_labels:
             label_map = {v: k for k, v in self.labels_id_map.items()}
-            label_pad = 0
-
-        features = []
-        for (ex_index, example) in enumerate(examples):
-            if ex_index % 10000 == 0:
-                logger.info("Processing example %d of %d", ex_index, len(examples))
-
-            tokens = []
-            labels = []
-            valid_tokens = []
-            for i, token in enumerate(example.tokens):
-                new_tokens = tokenizer.tokenize(token)
-                tokens.extend(new_tokens)
-                v_tok = [0] * (len(new_tokens))
-                v_tok[0] = 1
-                valid_tokens.extend(v_tok)
-                if include_labels:
-                    v_lbl = [label_pad] * (len(new_tokens))
-                    v_lbl[0] = label_map.get(example.label[i])
-                    labels.extend(v_lbl)
-
-            # truncate by max_seq_length
-            special_tokens_count = 3 if sep_token_extra else 2
-            tokens = tokens[: (max_seq_length - special_tokens_count)]
-            valid_tokens = valid_tokens[: (max_seq_length - special_tokens_count)]
-            if include_labels:
-                labels = labels[: (max_seq_length - special_tokens_count)]
 
-            tokens += [sep_token]
-            if include_labels:
-                labels += [label_pad]
-            valid_tokens += [0]
-            if sep_token_extra:  # roberta special case
-                tokens += [sep_token]
-                valid_tokens += [0]
-                if include_labels:
-                    labels += [label_pad]
-            segment_ids = [sequence_segment_id] * len(tokens)
-
-            if cls_token_at_end:
-                tokens = tokens + [cls_token]
-                segment_ids = segment_ids + [cls_token_segment_id]
-                if include_labels:
-                    labels = labels + [label_pad]
-                valid_tokens = valid_tokens + [0]
-            else:
-                tokens = [cls_token] + tokens
-                segment_ids = [cls_token_segment_id] + segment_ids
-                if include_labels:
-                    labels = [label_pad] + labels
-                valid_tokens = [0] + valid_tokens
-
-            input_ids = tokenizer.convert_tokens_to_ids(tokens)
-
-            input_mask = [1 if mask_padding_with_zero else 0] * len(input_ids)
-
-            # Zero-pad up to the sequence length.
-            padding_length = max_seq_length - len(input_ids)
-            if pad_on_left:
-                input_ids = ([pad_token] * padding_length) + input_ids
-                input_mask = ([0 if mask_padding_with_zero else 1] * padding_length) + input_mask
-                segment_ids = ([pad_token_segment_id] * padding_length) + segment_ids
-                if include_labels:
-                    labels = ([label_pad] * padding_length) + labels
-                valid_tokens = ([0] * padding_length) + valid_tokens
-            else:
-                input_ids = input_ids + ([pad_token] * padding_length)
-                input_mask = input_mask + ([0 if mask_padding_with_zero else 1] * padding_length)
-                segment_ids = segment_ids + ([pad_token_segment_id] * padding_length)
-                if include_labels:
-                    labels = labels + ([label_pad] * padding_length)
-                valid_tokens = valid_tokens + ([0] * padding_length)
-
-            assert len(input_ids) == max_seq_length
-            assert len(input_mask) == max_seq_length
-            assert len(segment_ids) == max_seq_length
-            assert len(valid_tokens) == max_seq_length
-            if include_labels:
-                assert len(labels) == max_seq_length
-
-            features.append(
-                InputFeatures(
-                    input_ids=input_ids,
-                    input_mask=input_mask,
-                    segment_ids=segment_ids,
-                    label_id=labels,
-                    valid_ids=valid_tokens,
-                )
+        logger.info("Processing %d examples using %d jobs", len(examples), n_jobs)
+        if n_jobs == 1:
+            return _convert_token_examples(
+                examples, max_seq_length, tokenizer, label_map=label_map, **kwargs
             )
-        return features
+
+        # avoid a deadlock in forked workers of the rust tokenizers thread pool
+        os.environ["TOKENIZERS_PARALLELISM"] = "false"
+        executor = Parallel(n_jobs=n_jobs, backend="multiprocessing")
+        do = delayed(partial(_convert_token_examples, **kwargs))
+        tasks = (
+            do(examples[i : i + batch_size], max_seq_length, tokenizer, label_map)
+            for i in range(0, len(examples), batch_size)
+        )
+        return TokenClsFeatures.concat(executor(tasks))
 
     def inference(
-        self, examples: List[TokenClsInputExample], max_seq_length: int, batch_size: int = 64
+        self,
+        examples: List[TokenClsInputExample],
+        max_seq_length: int,
+        batch_size: int = 64,
+        pad_to_multiple_of: int = 8,
     ):
         """
         Run inference on given examples
@@ -560,21 +924,32 @@ class TransformerTokenClassifier(TransformerBase):
         Args:
             examples (List[SequenceClsInputExample]): examples
             batch_size (int, optional): batch size. Defaults to 64.
+            pad_to_multiple_of (int, optional): pad each batch up to a multiple of this
+            value. Defaults to 8.
 
         Returns:
             logits
         """
-        data_set = self.convert_to_tensors(
-            examples, max_seq_length=max_seq_length, include_labels=False
+        features = self.convert_to_features(examples, max_seq_length, include_labels=False)
+        # sort by length so that each batch is padded only up to similar sized sequences
+        order = np.argsort(features.lengths, kind="stable").tolist()
+        batches = [order[i : i + batch_size] for i in range(0, len(order), batch_size)]
+        inf_dataloader = DataLoader(
+            features,
+            batch_sampler=batches,
+            collate_fn=partial(
+                pad_collate, pad_to_multiple_of=pad_to_multiple_of, **self.padding_args()
+            ),
         )
-        inf_sampler = SequentialSampler(data_set)
-        inf_dataloader = DataLoader(data_set, sampler=inf_sampler, batch_size=batch_size)
-        logits = self._evaluate(inf_dataloader)
-        active_positions = data_set.tensors[-1].view(len(data_set), -1) != 0.0
-        logits = torch.argmax(F.log_softmax(logits, dim=2), dim=2)
-        res_ids = []
-        for i in range(logits.size()[0]):
-            res_ids.append(logits[i][active_positions[i]].detach().cpu().numpy())
+        res_ids = [None] * len(features)
+        # batches are padded to different lengths, so the logits of each batch are
+        # handled as they come instead of being concatenated by _evaluate
+        for (batch, _, outputs), indices in zip(self._run_model(inf_dataloader), batches):
+            logits = torch.argmax(F.log_softmax(outputs[0], dim=2), dim=2)
+            active_positions = batch[3] != 0.0
+            # restore the original order of the examples
+            for row, ex_index in enumerate(indices):
+                res_ids[ex_index] = logits[row][active_positions[row]].detach().cpu().numpy()
         output = []
         for tag_ids, ex in zip(res_ids, examples):
             tokens = ex.tokens
@@ -0,0 +1,60 @@
+# ******************************************************************************
+# Copyright 2017-2019 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ******************************************************************************
+from typing import List
+
+import torch
+
+
+class BucketBatchSampler(torch.utils.data.Sampler):
+    r"""Batch sampler that groups samples of similar length into the same batch in
+    order to minimize padding when batches are padded dynamically.
+
+    Samples are shuffled and split into buckets of `batch_size * bucket_size_mult`
+    samples, each bucket is sorted by length and cut into batches, and the order
+    of the batches is shuffled.
+
+    Arguments:
+        lengths (List[int]): length of each sample in the dataset.
+        batch_size (int): batch size.
+        bucket_size_mult (int, optional): bucket size in batches (default: 100).
+        shuffle (bool, optional): shuffle samples and batches (default: True).
+    """
+
+    def __init__(
+        self, lengths: List[int], batch_size: int, bucket_size_mult: int = 100, shuffle=True
+    ):
+        self.lengths = lengths
+        self.batch_size = batch_size
+        self.bucket_size = batch_size * bucket_size_mult
+        self.shuffle = shuffle
+
+    def __iter__(self):
+        if self.shuffle:
+            indices = torch.randperm(len(self.lengths)).tolist()
+        else:
+            indices = list(range(len(self.lengths)))
+        batches = []
+        for i in range(0, len(indices), self.bucket_size):
+            bucket = sorted(indices[i : i + self.bucket_size], key=lambda j: self.lengths[j])
+            batches.extend(
+                bucket[j : j + self.batch_size] for j in range(0, len(bucket), self.batch_size)
+            )
+        if self.shuffle:
+            batches = [batches[i] for i in torch.randperm(len(batches)).tolist()]
+        return iter(batches)
+
+    def __len__(self):
+        return (len(self.lengths) + self.batch_size - 1) // self.batch_size
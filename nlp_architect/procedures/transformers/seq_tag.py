@@ -17,13 +17,16 @@ import argparse
 import io
 import logging
 import os
+from functools import partial
 
-from torch.utils.data import DataLoader, RandomSampler, SequentialSampler
+from torch.utils.data import DataLoader, SequentialSampler
 
 from nlp_architect.data.sequential_tagging import TokenClsInputExample, TokenClsProcessor
 from nlp_architect.data.utils import write_column_tagged_file
 from nlp_architect.models.transformers import TransformerTokenClassifier
+from nlp_architect.models.transformers.token_classification import pad_collate
 from nlp_architect.nn.torch import setup_backend, set_seed
+from nlp_architect.nn.torch.data.sampler import BucketBatchSampler
 from nlp_architect.procedures.procedure import Procedure
 from nlp_architect.procedures.registry import register_inference_cmd, register_train_cmd
 from nlp_architect.procedures.transformers.base import create_base_args, inference_args, train_args
@@ -61,6 +64,12 @@ class TransformerTokenClsTrain(Procedure):
             default="",
             help="a token to ignore when processing the data",
         )
+        parser.add_argument(
+            "--n_jobs",
+            type=int,
+            default=1,
+            help="number of processes used for converting examples to features (-1 for all CPUs)",
+        )
         parser.add_argument(
             "--best_result_file",
             type=str,
@@ -123,20 +132,44 @@ def do_training(args):
 
     train_batch_size = args.per_gpu_train_batch_size * max(1, n_gpus)
 
-    train_dataset = classifier.convert_to_tensors(train_ex, max_seq_length=args.max_seq_length)
-    train_sampler = RandomSampler(train_dataset)
-    train_dl = DataLoader(train_dataset, sampler=train_sampler, batch_size=train_batch_size)
+    # keep the train set unpadded, batch sequences of similar length together and
+    # pad each batch only up to its longest sequence
+    train_dataset = classifier.convert_to_features(
+        train_ex,
+        max_seq_length=args.max_seq_length,
+        n_jobs=args.n_jobs,
+        cache_dir=args.data_dir,
+        overwrite_cache=args.overwrite_cache,
+    )
+    train_sampler = BucketBatchSampler(train_dataset.lengths, train_batch_size)
+    train_dl = DataLoader(
+        train_dataset,
+        batch_sampler=train_sampler,
+        collate_fn=partial(pad_collate, pad_to_multiple_of=8, **classifier.padding_args()),
+    )
     dev_dl = None
     test_dl = None
     if dev_ex is not None:
-        dev_dataset = classifier.convert_to_tensors(dev_ex, max_seq_length=args.max_seq_length)
+        dev_dataset = classifier.convert_to_tensors(
+            dev_ex,
+            max_seq_length=args.max_seq_length,
+            n_jobs=args.n_jobs,
+            cache_dir=args.data_dir,
+            overwrite_cache=args.overwrite_cache,
+        )
         dev_sampler = SequentialSampler(dev_dataset)
         dev_dl = DataLoader(
             dev_dataset, sampler=dev_sampler, batch_size=args.per_gpu_eval_batch_size
         )
 
     if test_ex is not None:
-        test_dataset = classifier.convert_to_tensors(test_ex, max_seq_length=args.max_seq_length)
+        test_dataset = classifier.convert_to_tensors(
+            test_ex,
+            max_seq_length=args.max_seq_length,
+            n_jobs=args.n_jobs,
+            cache_dir=args.data_dir,
+            overwrite_cache=args.overwrite_cache,
+        )
         test_sampler = SequentialSampler(test_dataset)
         test_dl = DataLoader(
             test_dataset, sampler=test_sampler, batch_size=args.per_gpu_eval_batch_size
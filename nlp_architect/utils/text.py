@@ -348,27 +348,21 @@ def read_sequential_tagging_file(file_path, ignore_line_patterns=None):
     if ignore_line_patterns:
         assert isinstance(ignore_line_patterns, list), "ignore_line_patterns must be a list"
 
-    def _split_into_sentences(file_lines):
-        sentences = []
-        s = []
-        for line in file_lines:
-            if len(line) == 0:
+    sentences = []
+    s = []
+    with open(file_path, encoding="utf-8") as fp:
+        for line in fp:
+            line = line.strip()
+            if ignore_line_patterns and any(p in line for p in ignore_line_patterns):
+                continue
+            if not line:
                 sentences.append(s)
                 s = []
                 continue
-            s.append(line)
-        if len(s) > 0:
-            sentences.append(s)
-        return sentences
-
-    with open(file_path, encoding="utf-8") as fp:
-        data = fp.readlines()
-        data = [d.strip() for d in data]
-        if ignore_line_patterns:
-            for s in ignore_line_patterns:
-                data = [d for d in data if s not in d]
-        data = [tuple(d.split()) for d in data]
-    return _split_into_sentences(data)
+            s.append(tuple(line.split()))
+    if len(s) > 0:
+        sentences.append(s)
+    return sentences
 
 
 def word_vector_generator(data, lower=False, start=0):
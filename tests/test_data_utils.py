@@ -17,9 +17,11 @@
 import math
 import os
 import torch
-from nlp_architect.data.utils import split_column_dataset
+from nlp_architect.data.utils import read_column_tagged_file, split_column_dataset
 from tests.utils import count_examples
 from nlp_architect.nn.torch.data.dataset import CombinedTensorDataset
+from nlp_architect.nn.torch.data.sampler import BucketBatchSampler
+from nlp_architect.utils.text import read_sequential_tagging_file
 from torch.utils.data import TensorDataset
 
 
@@ -39,6 +41,16 @@ def test_concat_dataset():
     assert torch.equal(concat_dataset.tensors[1], expected_labels)
 
 
+def test_bucket_batch_sampler():
+    lengths = [5, 1, 4, 2, 3, 6, 8, 7, 9, 10]
+    sampler = BucketBatchSampler(lengths, batch_size=2, bucket_size_mult=5, shuffle=False)
+    assert list(sampler) == [[1, 3], [4, 2], [0, 5], [7, 6], [8, 9]]
+    sampler = BucketBatchSampler(lengths, batch_size=3, bucket_size_mult=2)
+    batches = list(sampler)
+    assert len(batches) == len(sampler) == 4
+    assert sorted(i for b in batches for i in b) == list(range(len(lengths)))
+
+
 def test_split_dataset():
     current_dir = os.path.dirname(os.path.realpath(__file__))
     data_dir = os.path.join(current_dir, "fixtures/data/distillation")
@@ -62,3 +74,31 @@ def test_split_dataset():
         assert check_unlabeled_count == math.ceil(num_of_examples * unlabeled_precentage)
         os.remove(data_dir + os.sep + "labeled.txt")
         os.remove(data_dir + os.sep + "unlabeled.txt")
+
+
+def test_read_column_tagged_file(tmpdir):
+    data_file = tmpdir.join("data.txt")
+    data_file.write("\n-DOCSTART- O\n\nEU NNP B-ORG\nrejects VBZ O\n \t\nPeter NNP B-PER\n\n\n")
+    assert read_column_tagged_file(str(data_file), ignore_token="-DOCSTART-") == [
+        (["EU", "rejects"], ["B-ORG", "O"]),
+        (["Peter"], ["B-PER"]),
+    ]
+    assert read_column_tagged_file(str(data_file), tag_col=1)[1] == (
+        ["EU", "rejects"],
+        ["NNP", "VBZ"],
+    )
+    # \x85 does not break lines, a non-breaking space only line separates sentences
+    data_file.write_text("a\x85x O\r\nb O\n\xa0\nc O\n", encoding="utf-8")
+    assert read_column_tagged_file(str(data_file)) == [(["a", "b"], ["O", "O"]), (["c"], ["O"])]
+    # bare \r line endings
+    data_file.write_text("a O\rb O\r\rc O\r", encoding="utf-8")
+    assert read_column_tagged_file(str(data_file)) == [(["a", "b"], ["O", "O"]), (["c"], ["O"])]
+
+
+def test_read_sequential_tagging_file(tmpdir):
+    data_file = tmpdir.join("data.txt")
+    data_file.write("-DOCSTART- O\n\nEU B-ORG\nrejects O\n\nPeter B-PER\n")
+    sentences = read_sequential_tagging_file(str(data_file), ignore_line_patterns=["-DOCSTART-"])
+    assert sentences == [[], [("EU", "B-ORG"), ("rejects", "O")], [("Peter", "B-PER")]]
+    # every sentence is a separate list
+    assert len({id(s) for s in sentences}) == len(sentences)
@@ -0,0 +1,313 @@
+# ******************************************************************************
+# Copyright 2017-2019 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ******************************************************************************
+import os
+import unicodedata
+from functools import partial
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+import torch
+from torch.utils.data import DataLoader
+
+from nlp_architect.data.sequential_tagging import TokenClsInputExample
+from nlp_architect.models.transformers.base_model import InputFeatures
+from nlp_architect.models.transformers.token_classification import (
+    TokenClsFeatures,
+    TransformerTokenClassifier,
+    _convert_token_examples,
+    pad_collate,
+)
+from nlp_architect.nn.torch.data.sampler import BucketBatchSampler
+
+
+class _PieceTokenizer(object):
+    """Splits words into 2 character word pieces, dropping control and format
+    characters like the BERT tokenizer"""
+
+    cls_token = "[CLS]"
+    sep_token = "[SEP]"
+    unk_token = "[UNK]"
+    pad_token = "[PAD]"
+    special_ids = {"[PAD]": 0, "[UNK]": 100, "[CLS]": 101, "[SEP]": 102}
+
+    def __len__(self):
+        return 30000
+
+    def tokenize(self, word):
+        word = "".join(c for c in word if unicodedata.category(c) not in ("Cc", "Cf"))
+        return [word[i : i + 2] for i in range(0, len(word), 2)]
+
+    def convert_tokens_to_ids(self, tokens):
+        # ids do not depend on call order so that worker processes agree
+        return [self.special_ids.get(t, 200 + sum(map(ord, t))) for t in tokens]
+
+    def num_added_tokens(self, pair=False):
+        return 3 if pair else 2
+
+
+def _features(include_labels=True):
+    return [
+        InputFeatures(
+            input_ids=[101, 7, 8, 102],
+            input_mask=[1, 1, 1, 1],
+            segment_ids=[0, 0, 0, 0],
+            label_id=[0, 1, 2, 0] if include_labels else None,
+            valid_ids=[0, 1, 1, 0],
+        ),
+        InputFeatures(
+            input_ids=[101, 9, 102],
+            input_mask=[1, 1, 1],
+            segment_ids=[0, 0, 0],
+            label_id=[0, 3, 0] if include_labels else None,
+            valid_ids=[0, 1, 0],
+        ),
+    ]
+
+
+def test_pad_collate_to_longest():
+    input_ids, input_mask, segment_ids, valid_ids, label_ids = pad_collate(_features(), pad_token=5)
+    assert torch.equal(input_ids, torch.tensor([[101, 7, 8, 102], [101, 9, 102, 5]]))
+    assert torch.equal(input_mask, torch.tensor([[1, 1, 1, 1], [1, 1, 1, 0]]))
+    assert torch.equal(segment_ids, torch.zeros(2, 4, dtype=torch.long))
+    assert torch.equal(valid_ids, torch.tensor([[0, 1, 1, 0], [0, 1, 0, 0]]))
+    assert torch.equal(label_ids, torch.tensor([[0, 1, 2, 0], [0, 3, 0, 0]]))
+
+
+def test_pad_collate_on_left_without_labels():
+    tensors = pad_collate(
+        _features(include_labels=False), pad_on_left=True, pad_token_segment_id=4, max_length=6
+    )
+    assert len(tensors) == 4
+    input_ids, input_mask, segment_ids, _ = tensors
+    assert torch.equal(input_ids[1], torch.tensor([0, 0, 0, 101, 9, 102]))
+    assert torch.equal(input_mask[1], torch.tensor([0, 0, 0, 1, 1, 1]))
+    assert torch.equal(segment_ids[1], torch.tensor([4, 4, 4, 0, 0, 0]))
+
+
+def test_pad_collate_to_multiple_of():
+    input_ids = pad_collate(_features(), pad_to_multiple_of=8)[0]
+    assert input_ids.shape == (2, 8)
+
+
+def test_token_cls_features_layout():
+    features = TokenClsFeatures.from_features(_features())
+    assert features.offsets.tolist() == [0, 4, 7]
+    assert features.lengths.tolist() == [4, 3]
+    assert features.input_ids.tolist() == [101, 7, 8, 102, 101, 9, 102]
+    assert features[1].label_id.tolist() == [0, 3, 0]
+    features = TokenClsFeatures.concat([features, TokenClsFeatures.from_features(_features())])
+    assert len(features) == 4
+    assert features[2].input_ids.tolist() == [101, 7, 8, 102]
+    for a, b in zip(pad_collate(features), pad_collate(_features() + _features())):
+        assert torch.equal(a, b)
+
+
+def test_token_cls_features_save_load(tmpdir):
+    features = TokenClsFeatures.from_features(_features(include_labels=False))
+    path = str(tmpdir.join("features.npz"))
+    features.save(path)
+    loaded = TokenClsFeatures.load(path)
+    assert loaded.label_id is None
+    for a, b in zip(pad_collate(features), pad_collate(loaded)):
+        assert torch.equal(a, b)
+
+
+def _examples():
+    return [
+        TokenClsInputExample("0", "", ["abcde", "x", "yz"], label=["B", "O", "I"]),
+        TokenClsInputExample("1", "", ["abcdefghij", "x"], label=["O", "B"]),
+        TokenClsInputExample("2", "", ["x", "abc"], label=["B", "I"]),
+    ]
+
+
+class _PieceIdModel(object):
+    """Predicts the label id `input_id % 4` for each word piece"""
+
+    def eval(self):
+        pass
+
+    def __call__(self, input_ids, **kwargs):
+        return (torch.nn.functional.one_hot(input_ids % 4, 4).float(),)
+
+
+def _classifier():
+    """A stand-in for `TransformerTokenClassifier` with the feature conversion methods"""
+    classifier = SimpleNamespace(
+        model_type="bert",
+        model_name_or_path="bert-base-cased",
+        tokenizer_name=None,
+        tokenizer=_PieceTokenizer(),
+        do_lower_case=False,
+        labels=["O", "B", "I"],
+        labels_id_map={1: "O", 2: "B", 3: "I"},
+        model=_PieceIdModel(),
+        device="cpu",
+    )
+    for name in (
+        "convert_to_features",
+        "convert_to_shards",
+        "_features_cache_key",
+        "_convert_examples_to_features",
+        "padding_args",
+        "inference",
+        "_run_model",
+        "_batch_mapper",
+    ):
+        setattr(classifier, name, getattr(TransformerTokenClassifier, name).__get__(classifier))
+    return classifier
+
+
+def test_convert_token_examples_alignment():
+    examples = _examples()[:2]
+    features = _convert_token_examples(
+        examples, 7, _PieceTokenizer(), label_map={"O": 1, "B": 2, "I": 3}
+    )
+    assert features.lengths.tolist() == [7, 7]
+    # [CLS] ab cd e x yz [SEP]
+    assert features[0].valid_ids.tolist() == [0, 1, 0, 0, 1, 1, 0]
+    assert features[0].label_id.tolist() == [0, 2, 0, 0, 1, 3, 0]
+    # [CLS] ab cd ef gh ij [SEP], "x" is truncated
+    assert features[1].valid_ids.tolist() == [0, 1, 0, 0, 0, 0, 0]
+    assert features[1].label_id.tolist() == [0, 1, 0, 0, 0, 0, 0]
+    assert features[1].input_ids.tolist()[-1] == 102
+    # a word without word pieces keeps its label as an unknown token
+    features = _convert_token_examples(
+        [TokenClsInputExample("2", "", ["x", "\u00ad", "yz"], label=["B", "O", "I"])],
+        7,
+        _PieceTokenizer(),
+        label_map={"O": 1, "B": 2, "I": 3},
+    )
+    assert features[0].input_ids.tolist()[2] == 100
+    assert features[0].valid_ids.tolist() == [0, 1, 1, 1, 0]
+    assert features[0].label_id.tolist() == [0, 2, 1, 3, 0]
+
+
+def test_convert_token_examples_special_tokens_budget():
+    class _ThreeSpecialTokensTokenizer(_PieceTokenizer):
+        def num_added_tokens(self, pair=False):
+            return 3
+
+    label_map = {"O": 1, "B": 2, "I": 3}
+    for tokenizer, sep_token_extra in (
+        (_PieceTokenizer(), True),
+        (_ThreeSpecialTokensTokenizer(), False),
+    ):
+        features = _convert_token_examples(
+            _examples()[1:2], 7, tokenizer, label_map=label_map, sep_token_extra=sep_token_extra
+        )
+        # [CLS] ab cd ef gh [SEP] [SEP], "ij" and "x" are truncated
+        assert features.lengths.tolist() == [7]
+        assert features[0].input_ids.tolist()[0] == 101
+        assert features[0].input_ids.tolist()[-2:] == [102, 102]
+        assert features[0].valid_ids.tolist() == [0, 1, 0, 0, 0, 0, 0]
+
+
+def test_convert_examples_to_features_in_parallel():
+    classifier = SimpleNamespace(labels_id_map={1: "O", 2: "B", 3: "I"})
+    convert = partial(
+        TransformerTokenClassifier._convert_examples_to_features,
+        classifier,
+        max_seq_length=7,
+        tokenizer=_PieceTokenizer(),
+    )
+    serial = convert(_examples())
+    parallel = convert(_examples(), n_jobs=2, batch_size=1)
+    for a, b in zip(pad_collate(serial), pad_collate(parallel)):
+        assert torch.equal(a, b)
+    assert len(convert([], n_jobs=2)) == 0
+
+
+def test_dataloader_pads_each_batch():
+    features = TokenClsFeatures.from_features(_features() + _features()[1:])
+    loader = DataLoader(features, batch_size=2, collate_fn=pad_collate)
+    assert [batch[0].shape for batch in loader] == [(2, 4), (1, 3)]
+
+
+def test_dataloader_with_bucket_batch_sampler():
+    features = TokenClsFeatures.from_features(_features() * 3)
+    sampler = BucketBatchSampler(features.lengths, batch_size=3)
+    loader = DataLoader(features, batch_sampler=sampler, collate_fn=pad_collate)
+    # similar lengths are batched together, so no batch is padded
+    assert sorted(batch[1].sum().item() for batch in loader) == [9, 12]
+
+
+def test_token_cls_features_interrupted_save(tmpdir, monkeypatch):
+    def interrupted_savez(*args, **kwargs):
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(np, "savez", interrupted_savez)
+    with pytest.raises(KeyboardInterrupt):
+        TokenClsFeatures.from_features(_features()).save(str(tmpdir.join("features.npz")))
+    assert len(tmpdir.listdir()) == 0
+
+
+def test_convert_to_features_cache(tmpdir):
+    classifier = _classifier()
+    features = classifier.convert_to_features(_examples(), 7, cache_dir=str(tmpdir))
+    # only the cache file is left in the cache directory
+    assert len(tmpdir.listdir()) == 1
+    calls = []
+    classifier._convert_examples_to_features = lambda *args, **kwargs: calls.append(args)
+    cached = classifier.convert_to_features(_examples(), 7, cache_dir=str(tmpdir))
+    assert len(calls) == 0
+    for a, b in zip(pad_collate(features), pad_collate(cached)):
+        assert torch.equal(a, b)
+
+    key = classifier._features_cache_key(_examples(), 7, True)
+    assert key == classifier._features_cache_key(_examples(), 7, True)
+    assert key != classifier._features_cache_key(_examples(), 8, True)
+    assert key != classifier._features_cache_key(_examples(), 7, False)
+    assert key != classifier._features_cache_key(_examples()[:2], 7, True)
+    classifier.labels = ["O", "B"]
+    assert key != classifier._features_cache_key(_examples(), 7, True)
+
+
+def test_convert_to_shards(tmpdir):
+    classifier = _classifier()
+    examples = _examples() + _examples()[:2]
+    shard_dir = str(tmpdir.join("shards"))
+    shard_paths = classifier.convert_to_shards(
+        (example for example in examples), shard_dir, 7, shard_size=2
+    )
+    assert shard_paths == [
+        os.path.join(shard_dir, "token_features_{:05d}.npz".format(i)) for i in range(3)
+    ]
+    shards = [TokenClsFeatures.load(path) for path in shard_paths]
+    assert [len(shard) for shard in shards] == [2, 2, 1]
+    features = classifier.convert_to_features(examples, 7)
+    for a, b in zip(pad_collate(features), pad_collate(TokenClsFeatures.concat(shards))):
+        assert torch.equal(a, b)
+
+
+def test_inference_restores_example_order():
+    classifier = _classifier()
+    examples = [
+        TokenClsInputExample("0", "", ["abcde", "x", "yz"]),
+        TokenClsInputExample("1", "", ["q"]),
+        TokenClsInputExample("2", "", ["x", "\u00ad", "abcdef", "rs"]),
+        TokenClsInputExample("3", "", ["yz", "ab"]),
+    ]
+    tokenizer = _PieceTokenizer()
+    expected = []
+    for example in examples:
+        first_piece_ids = [
+            tokenizer.convert_tokens_to_ids((tokenizer.tokenize(t) or ["[UNK]"])[:1])[0]
+            for t in example.tokens
+        ]
+        tags = [classifier.labels_id_map.get(i % 4, "O") for i in first_piece_ids]
+        expected.append((example.tokens, tags))
+    assert classifier.inference(examples, 16, batch_size=2) == expected